@@ -5,24 +5,76 @@ import sys
 import os
 from collections import defaultdict
 
+# Optional faster JSON decoding for large logs
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # Optional dependencies for plotting and tables
 try:
     from tabulate import tabulate
+    import matplotlib
+    matplotlib.use('Agg')  # Plots are only saved to PNG; skip loading a GUI backend
     import matplotlib.pyplot as plt
+    plt.ioff()
     import numpy as np
     PLOTTING_ENABLED = True
 except ImportError:
     PLOTTING_ENABLED = False
 
+def summarize_stats(stats):
+    """
+    Reduces aggregated stats for one group to a tuple of
+    (average Brier score, accuracy, average duration).
+    """
+    total_count = stats['total_count']
+    if total_count == 0:
+        return float('inf'), 0, 0
+
+    avg_brier = stats['brier_sum'] / total_count
+    accuracy = stats['correct_count'] / total_count
+    avg_duration = stats['duration_sum'] / total_count
+    return avg_brier, accuracy, avg_duration
+
 def analyze_log_file(filepath):
     """
     Analyzes a JSONL log file to compute per-category and overall winners
     based on the Brier score, generating JSON, TXT, and plot outputs.
     """
     print(f"Analyzing log file: {filepath}")
+
+    # 1. Aggregate stats for Brier score, accuracy, and duration while streaming the log
+    category_model_stats = defaultdict(lambda: defaultdict(lambda: {'brier_sum': 0.0, 'correct_count': 0, 'total_count': 0, 'duration_sum': 0.0}))
+    overall_model_stats = defaultdict(lambda: {'brier_sum': 0.0, 'correct_count': 0, 'total_count': 0, 'duration_sum': 0.0})
+
     try:
-        with open(filepath, 'r') as f:
-            results = [json.loads(line) for line in f]
+        with open(filepath, 'rb') as f:
+            for line in f:
+                r = json_loads(line)
+                model = r['model']
+                true_intent = r['category']
+                predicted_intent = r.get('intent', 'unknown')
+                confidence = r.get('confidence', 0.0)
+                duration = r.get('duration', 0.0)
+
+                is_correct = 1 if true_intent == predicted_intent else 0
+                brier_score = (confidence - is_correct)**2
+
+                # Per-category aggregation
+                cat_stats = category_model_stats[true_intent][model]
+                cat_stats['brier_sum'] += brier_score
+                cat_stats['correct_count'] += is_correct
+                cat_stats['total_count'] += 1
+                cat_stats['duration_sum'] += duration
+
+                # Overall aggregation
+                over_stats = overall_model_stats[model]
+                over_stats['brier_sum'] += brier_score
+                over_stats['correct_count'] += is_correct
+                over_stats['total_count'] += 1
+                over_stats['duration_sum'] += duration
     except FileNotFoundError:
         print(f"Error: Log file not found at '{filepath}'")
         sys.exit(1)
@@ -30,105 +82,51 @@ def analyze_log_file(filepath):
         print(f"Error: Could not decode JSON from '{filepath}'. Invalid format on line. {e}")
         sys.exit(1)
 
-    if not results:
+    if not overall_model_stats:
         print("Log file is empty. Nothing to analyze.")
         return
 
-    # 1. Aggregate stats for Brier score, accuracy, and duration
-    category_model_stats = defaultdict(lambda: defaultdict(lambda: {'brier_scores': [], 'correct_count': 0, 'total_count': 0, 'durations': []}))
-    overall_model_stats = defaultdict(lambda: {'brier_scores': [], 'correct_count': 0, 'total_count': 0, 'durations': []})
-
-    for r in results:
-        model = r['model']
-        true_intent = r['category']
-        predicted_intent = r.get('intent', 'unknown')
-        confidence = r.get('confidence', 0.0)
-        duration = r.get('duration', 0.0)
-
-        is_correct = 1 if true_intent == predicted_intent else 0
-        brier_score = (confidence - is_correct)**2
-
-        # Per-category aggregation
-        cat_stats = category_model_stats[true_intent][model]
-        cat_stats['brier_scores'].append(brier_score)
-        cat_stats['correct_count'] += is_correct
-        cat_stats['total_count'] += 1
-        cat_stats['durations'].append(duration)
-
-        # Overall aggregation
-        over_stats = overall_model_stats[model]
-        over_stats['brier_scores'].append(brier_score)
-        over_stats['correct_count'] += is_correct
-        over_stats['total_count'] += 1
-        over_stats['durations'].append(duration)
-
     summary = {
         'per_category': {},
         'overall_winner': {},
         'model_performance_summary': []
     }
-    
+
     # 2. Determine per-category winners (lowest Brier score wins)
     for category, models_data in category_model_stats.items():
-        best_model = None
-        lowest_brier_score = float('inf')
-
-        for model, stats in models_data.items():
-            avg_brier = sum(stats['brier_scores']) / len(stats['brier_scores']) if stats['brier_scores'] else float('inf')
-            if avg_brier < lowest_brier_score:
-                lowest_brier_score = avg_brier
-                best_model = model
-        
-        if best_model:
-            winner_stats = category_model_stats[category][best_model]
-            accuracy = winner_stats['correct_count'] / winner_stats['total_count'] if winner_stats['total_count'] > 0 else 0
-            avg_duration = sum(winner_stats['durations']) / len(winner_stats['durations']) if winner_stats['durations'] else 0
-
-            summary['per_category'][category] = {
-                'best_model': best_model,
-                'brier_score': round(lowest_brier_score, 4),
-                'accuracy': round(accuracy, 4),
-                'average_duration': round(avg_duration, 2)
-            }
+        category_metrics = {model: summarize_stats(stats) for model, stats in models_data.items()}
+        best_model, (avg_brier, accuracy, avg_duration) = min(category_metrics.items(), key=lambda item: item[1][0])
 
-    # 3. Determine overall winner (lowest Brier score wins)
-    overall_winner_model = None
-    lowest_overall_brier = float('inf')
-
-    for model, stats in overall_model_stats.items():
-        avg_brier = sum(stats['brier_scores']) / len(stats['brier_scores']) if stats['brier_scores'] else float('inf')
-        if avg_brier < lowest_overall_brier:
-            lowest_overall_brier = avg_brier
-            overall_winner_model = model
-    
-    if overall_winner_model:
-        winner_stats = overall_model_stats[overall_winner_model]
-        accuracy = winner_stats['correct_count'] / winner_stats['total_count'] if winner_stats['total_count'] > 0 else 0
-        avg_duration = sum(winner_stats['durations']) / len(winner_stats['durations']) if winner_stats['durations'] else 0
-
-        summary['overall_winner'] = {
-            'model': overall_winner_model,
-            'brier_score': round(lowest_overall_brier, 4),
+        summary['per_category'][category] = {
+            'best_model': best_model,
+            'brier_score': round(avg_brier, 4),
             'accuracy': round(accuracy, 4),
             'average_duration': round(avg_duration, 2)
         }
 
+    # 3. Determine overall winner (lowest Brier score wins)
+    model_metrics = {model: summarize_stats(stats) for model, stats in overall_model_stats.items()}
+    overall_winner_model, (avg_brier, accuracy, avg_duration) = min(model_metrics.items(), key=lambda item: item[1][0])
+
+    summary['overall_winner'] = {
+        'model': overall_winner_model,
+        'brier_score': round(avg_brier, 4),
+        'accuracy': round(accuracy, 4),
+        'average_duration': round(avg_duration, 2)
+    }
+
     # 4. Create summary table data
-    table_data = []
-    for model, stats in sorted(overall_model_stats.items()):
-        total_count = stats['total_count']
-        correct_count = stats['correct_count']
-        avg_brier = sum(stats['brier_scores']) / len(stats['brier_scores']) if stats['brier_scores'] else float('inf')
-        avg_duration = sum(stats['durations']) / len(stats['durations']) if stats['durations'] else 0
-
-        table_data.append({
+    table_data = [
+        {
             'model': model,
-            'correct_predictions': correct_count,
-            'incorrect_predictions': total_count - correct_count,
-            'accuracy': round(correct_count / total_count if total_count > 0 else 0, 4),
+            'correct_predictions': overall_model_stats[model]['correct_count'],
+            'incorrect_predictions': overall_model_stats[model]['total_count'] - overall_model_stats[model]['correct_count'],
+            'accuracy': round(accuracy, 4),
             'brier_score': round(avg_brier, 4),
             'average_duration': round(avg_duration, 2)
-        })
+        }
+        for model, (avg_brier, accuracy, avg_duration) in sorted(model_metrics.items())
+    ]
     summary['model_performance_summary'] = table_data
 
     # 5. Create output directory and save all files
@@ -180,19 +178,23 @@ def create_plots(table_data, output_dir):
         print("No data to plot.")
         return
 
+    # Both plots are drawn on one reused figure, cleared between plots
+    fig = plt.figure(figsize=(12, 7))
+
     # Accuracy Plot (Higher is better)
     accuracy = [d['accuracy'] for d in table_data]
-    plt.figure(figsize=(12, 7))
-    bars = plt.bar(models, accuracy, color='lightgreen')
-    plt.ylabel('Accuracy')
-    plt.title('Model Comparison: Accuracy (Higher is Better)')
-    plt.ylim(0, 1)
-    plt.xticks(rotation=45, ha="right")
-    plt.bar_label(bars, fmt='%.2f')
-    plt.tight_layout()
+    ax = fig.add_subplot()
+    bars = ax.bar(models, accuracy, color='lightgreen')
+    ax.set_ylabel('Accuracy')
+    ax.set_title('Model Comparison: Accuracy (Higher is Better)')
+    ax.set_ylim(0, 1)
+    ax.tick_params(axis='x', labelrotation=45)
+    plt.setp(ax.get_xticklabels(), ha="right")
+    ax.bar_label(bars, fmt='%.2f')
+    fig.tight_layout()
     accuracy_plot_path = os.path.join(output_dir, 'accuracy_comparison.png')
-    plt.savefig(accuracy_plot_path)
-    plt.close()
+    fig.savefig(accuracy_plot_path)
+    fig.clf()
     print(f"Accuracy plot saved to: {accuracy_plot_path}")
 
     # Combined Brier Score and Duration Plot
@@ -202,7 +204,7 @@ def create_plots(table_data, output_dir):
     x = np.arange(len(models))
     width = 0.35
 
-    fig, ax1 = plt.subplots(figsize=(12, 7))
+    ax1 = fig.add_subplot()
 
     # Bar for Brier Score
     color1 = 'skyblue'
@@ -227,8 +229,8 @@ def create_plots(table_data, output_dir):
     fig.tight_layout()
     
     brier_duration_plot_path = os.path.join(output_dir, 'brier_duration_comparison.png')
-    plt.savefig(brier_duration_plot_path)
-    plt.close()
+    fig.savefig(brier_duration_plot_path)
+    plt.close(fig)
     print(f"Combined Brier/duration plot saved to: {brier_duration_plot_path}")
 
 
@@ -1,13 +1,56 @@
 # Main script to run the intent classification benchmark against local LLMs.
 
+import argparse
+import contextlib
+import hashlib
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import shelve
 import sys
 import json
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+# Optional faster JSON encoding/decoding. json_dumps returns UTF-8 bytes.
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
+
 OLLAMA_API_URL = "http://localhost:11434"
+# Number of in-flight requests per model, matched to the number of requests the
+# Ollama server handles in parallel (OLLAMA_NUM_PARALLEL, sequential by default).
+# Do not set this above the server's capacity: extra requests queue server-side,
+# the wait counts towards both the recorded duration and the 60 s request
+# timeout, and queries that time out are dropped from the results.
+MAX_WORKERS = int(os.environ.get("OLLAMA_NUM_PARALLEL", "1"))
+# On-disk cache of successful responses, keyed on model, prompt, and query
+CACHE_PATH = ".llm_intent_cache"
+# Shared session so connections to Ollama are kept alive and pooled across
+# requests and worker threads. Only failed connection attempts are retried
+# (never read errors or error statuses), but a recorded duration can still
+# include those reconnects and their short backoff.
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.1)
+))
+# Results are written through a large buffer and synced to disk every N records
+RESULTS_BUFFER_SIZE = 1 << 20
+FSYNC_EVERY = 16
+
+def sync_to_disk(f):
+    """Flushes a file's buffer and forces its contents to disk."""
+    f.flush()
+    os.fsync(f.fileno())
 
 def check_ollama_http():
     """
@@ -16,7 +59,7 @@ def check_ollama_http():
     """
     print(f"Verifying Ollama connection at {OLLAMA_API_URL}...")
     try:
-        response = requests.get(f"{OLLAMA_API_URL}/api/tags", timeout=5)
+        response = SESSION.get(f"{OLLAMA_API_URL}/api/tags", timeout=5)
         response.raise_for_status()
         print("Ollama connection successful.")
     except (requests.exceptions.RequestException, requests.exceptions.HTTPError) as e:
@@ -27,13 +70,13 @@ def check_ollama_http():
 def get_available_models_http():
     """Fetches the list of available models from the Ollama API."""
     try:
-        response = requests.get(f"{OLLAMA_API_URL}/api/tags")
+        response = SESSION.get(f"{OLLAMA_API_URL}/api/tags")
         response.raise_for_status()
-        data = response.json()
+        data = json_loads(response.content)
         models = [m["name"] for m in data.get("models", [])]
         print(f"Found {len(models)} available models.")
         return models
-    except (requests.exceptions.RequestException, requests.exceptions.HTTPError) as e:
+    except (requests.exceptions.RequestException, requests.exceptions.HTTPError, json.JSONDecodeError) as e:
         print(f"Error fetching models: {e}")
         return []
 
@@ -55,12 +98,12 @@ def run_intent_classification_http(model, system_prompt, user_query):
         "prompt": f"{system_prompt}\nUser: {user_query}",
         "stream": False,
         "format": "json",
-        "temperature": 0
+        "options": {"temperature": 0}
     }
     
     start_time = time.monotonic()
     try:
-        response = requests.post(
+        response = SESSION.post(
             f"{OLLAMA_API_URL}/api/generate",
             headers={"Content-Type": "application/json"},
             json=payload,
@@ -68,14 +111,69 @@ def run_intent_classification_http(model, system_prompt, user_query):
         )
         response.raise_for_status()
         duration = time.monotonic() - start_time
-        data = response.json()
+        data = json_loads(response.content)
         return data.get("response", "").strip(), duration
-    except (requests.exceptions.RequestException, requests.exceptions.HTTPError) as e:
+    except (requests.exceptions.RequestException, requests.exceptions.HTTPError, json.JSONDecodeError) as e:
         print(f"Error during API call for model {model}: {e}")
         return None, 0
 
+def parse_intent_response(response_text):
+    """
+    Parses a model response into an (intent, confidence) tuple.
+    Raises ValueError unless it is a JSON object with an 'intent' key and a
+    numeric or missing 'confidence'.
+    """
+    parsed = json_loads(response_text)
+    if not isinstance(parsed, dict) or 'intent' not in parsed:
+        raise ValueError("expected a JSON object with an 'intent' key")
+    raw_confidence = parsed.get('confidence')
+    try:
+        confidence = float(raw_confidence) if raw_confidence is not None else 0.0
+    except (TypeError, ValueError):
+        raise ValueError(f"non-numeric confidence: {raw_confidence!r}")
+    return parsed['intent'], confidence
+
+def run_intent_classification_cached(cache, cache_lock, model, system_prompt, user_query, refresh=False):
+    """
+    Wraps run_intent_classification_http with a lookup in the on-disk response cache.
+    Returns the response string, the request duration, and whether it came from the cache.
+    A cache hit returns the duration measured when the response was first cached.
+    Requests are sent with temperature 0, so a cached response stands in for a repeat call.
+    Only responses accepted by parse_intent_response are stored, so failed or malformed
+    answers are retried on the next run. If refresh is True, the lookup is skipped and
+    the new response overwrites the cached one. If cache is None, always calls through.
+    """
+    if cache is None:
+        response_text, duration = run_intent_classification_http(model, system_prompt, user_query)
+        return response_text, duration, False
+
+    key = hashlib.blake2b(f"{model}|{system_prompt}|{user_query}".encode()).hexdigest()
+    if not refresh:
+        with cache_lock:
+            if key in cache:
+                response_text, duration = cache[key]
+                return response_text, duration, True
+
+    response_text, duration = run_intent_classification_http(model, system_prompt, user_query)
+    if response_text is not None:
+        try:
+            parse_intent_response(response_text)
+        except ValueError:
+            return response_text, duration, False
+        with cache_lock:
+            cache[key] = (response_text, duration)
+    return response_text, duration, False
+
 def main():
     """Main function to run the benchmark."""
+    parser = argparse.ArgumentParser(description="Run the LLM intent classification benchmark against Ollama.")
+    cache_options = parser.add_mutually_exclusive_group()
+    cache_options.add_argument('--no-cache', action='store_true',
+                               help=f"Query Ollama for every prompt without reading or writing the cache in '{CACHE_PATH}'.")
+    cache_options.add_argument('--refresh-cache', action='store_true',
+                               help=f"Query Ollama for every prompt and overwrite the responses cached in '{CACHE_PATH}'.")
+    args = parser.parse_args()
+
     # 1. Ensure Ollama HTTP endpoint is up
     check_ollama_http()
 
@@ -178,36 +276,57 @@ def main():
     print(f"\nStarting benchmark... Output will be saved to '{results_filename}'")
     
     # 5. Run tests and save results to a JSONL file
-    with open(results_filename, 'a') as f:
-        for model in models:
-            print(f"\nTesting model: {model}")
-            for category, queries in test_queries.items():
-                for query in queries:
-                    response_text, duration = run_intent_classification_http(model, system_prompt, query)
-                    
-                    if response_text is None:
-                        continue
-                    
-                    try:
-                        parsed = json.loads(response_text)
-                        intent = parsed.get('intent', 'unknown')
-                        raw_confidence = parsed.get('confidence')
-                        confidence = float(raw_confidence) if raw_confidence is not None else 0.0
-                        print(f"  Success: '{query}' -> {intent} ({confidence:.2f}) in {duration:.2f}s")
-                    except json.JSONDecodeError:
-                        print(f"  Failed to parse JSON from model {model} for query '{query}': {response_text}")
-                        intent = 'error'
-                        confidence = 0.0
-
-                    record = {
-                        'model': model,
-                        'category': category,
-                        'query': query,
-                        'intent': intent,
-                        'confidence': confidence,
-                        'duration': round(duration, 2)
+    cache_lock = threading.Lock()
+    cache_context = contextlib.nullcontext() if args.no_cache else shelve.open(CACHE_PATH)
+    with cache_context as cache, open(results_filename, 'ab', buffering=RESULTS_BUFFER_SIZE) as f:
+        records_written = 0
+        try:
+            for model in models:
+                print(f"\nTesting model: {model}")
+                with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                    futures = {
+                        executor.submit(run_intent_classification_cached, cache, cache_lock, model, system_prompt, query, args.refresh_cache): (category, query)
+                        for category, queries in test_queries.items()
+                        for query in queries
                     }
-                    f.write(json.dumps(record) + "\n")
+                    # On an error or Ctrl-C, drop queued requests instead of letting
+                    # the executor's shutdown wait for all of them to be sent
+                    try:
+                        for future in as_completed(futures):
+                            category, query = futures[future]
+                            response_text, duration, cached = future.result()
+
+                            if response_text is None:
+                                continue
+
+                            try:
+                                intent, confidence = parse_intent_response(response_text)
+                                print(f"  Success: '{query}' -> {intent} ({confidence:.2f}) in {duration:.2f}s{' (cached)' if cached else ''}")
+                            except ValueError:
+                                print(f"  Failed to parse intent JSON from model {model} for query '{query}': {response_text}")
+                                intent = 'error'
+                                confidence = 0.0
+
+                            record = {
+                                'model': model,
+                                'category': category,
+                                'query': query,
+                                'intent': intent,
+                                'confidence': confidence,
+                                'duration': round(duration, 2),
+                                'cached': cached
+                            }
+                            f.write(json_dumps(record))
+                            f.write(b"\n")
+                            records_written += 1
+                            if records_written % FSYNC_EVERY == 0:
+                                sync_to_disk(f)
+                    except BaseException:
+                        for pending in futures:
+                            pending.cancel()
+                        raise
+        finally:
+            sync_to_disk(f)
 
     print(f"\nBenchmark complete. All results saved to: {results_filename}")
 